@@ -1,19 +1,109 @@
+import ipaddress
 import json
 import os
 import platform
 import subprocess
 import re
+import socket
+import threading
+import time
 from datetime import datetime
 
+try:
+    import orjson
+    
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, indent=2).encode()
+    
+    _loads = json.loads
+
+_SYSTEM = platform.system()
+_IS_WINDOWS = _SYSTEM == "Windows"
+
+def run_command(cmd, **kwargs):
+    """Run a command, skipping close_fds handle setup on Windows"""
+    return subprocess.run(cmd, close_fds=not _IS_WINDOWS, **kwargs)
+
+_WIN_IPV4_RE = re.compile(r'(\d+\.\d+\.\d+\.\d+)')
+_LIN_DEFAULT_DEV_RE = re.compile(r'default\b.*?\bdev\s+(\S+)')
+_LIN_INET_RE = re.compile(r'inet (\d+\.\d+\.\d+\.\d+)/(\d+)')
+
 class Config:
     def __init__(self):
-        self._network_info = self._detect_network_info()
+        self._blacklist_cache = {}
+        self._blacklist_mtime = None
+        self._synced_blocklist = None
+        self._network_info = None
+        self._network_binding = None
+        self._network_checked = 0
+    
+    def _get_network_info(self):
+        """Return cached network info, re-detecting only when the IP binding changes"""
+        now = time.monotonic()
+        if self._network_info is not None and now - self._network_checked < self.NETWORK_CACHE_TTL:
+            return self._network_info
+        self._network_checked = now
+        
+        binding = self._probe_ip_binding()
+        if self._network_info is None and binding:
+            # Reuse detection from a previous run if nothing changed since
+            cached = self._load_network_cache()
+            if cached and cached.get('binding') == binding:
+                self._network_info = cached['info']
+                self._network_binding = binding
+        
+        if self._network_info is None or binding != self._network_binding:
+            self._network_info = self._detect_network_info()
+            self._network_binding = binding
+            self._save_network_cache(binding, self._network_info)
+        
+        return self._network_info
+    
+    def _probe_ip_binding(self):
+        """Cheap probe of the source address the default route uses"""
+        try:
+            # connect() on a UDP socket only picks a route; no packets are sent
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(('192.0.2.1', 9))
+                return sock.getsockname()[0]
+        except OSError:
+            return None
+    
+    def _load_network_cache(self):
+        """Load persisted network info for the current platform"""
+        try:
+            if os.path.exists(self.NETWORK_CACHE_FILE):
+                with open(self.NETWORK_CACHE_FILE, 'rb') as f:
+                    cached = _loads(f.read())
+                if cached.get('system') == _SYSTEM:
+                    return cached
+        except Exception as e:
+            print(f"Error loading network cache: {e}")
+        return None
+    
+    def _save_network_cache(self, binding, network_info):
+        """Persist network info so restarts can skip detection"""
+        # Don't persist the fallback values
+        if network_info['local_ip'] == 'Unknown':
+            return
+        try:
+            with open(self.NETWORK_CACHE_FILE, 'wb') as f:
+                f.write(_dumps({
+                    'system': _SYSTEM,
+                    'binding': binding,
+                    'info': network_info
+                }))
+        except Exception as e:
+            print(f"Error saving network cache: {e}")
     
     def _detect_network_info(self):
         """Dynamically detect network interface and range"""
-        system = platform.system()
-        
-        if system == "Windows":
+        if _IS_WINDOWS:
             return self._detect_windows_network()
         else:
             return self._detect_linux_network()
@@ -21,26 +111,42 @@ class Config:
     def _detect_windows_network(self):
         """Detect network info on Windows"""
         try:
-            # Get network interface info using ipconfig
-            result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=10)
-            lines = result.stdout.split('\n')
-            
+            network_info = self._detect_windows_network_psutil()
+            if network_info:
+                return network_info
+        except ImportError:
+            pass  # Fall back to parsing ipconfig
+        except Exception as e:
+            print(f"Windows network detection error: {e}")
+        
+        try:
             interface = "Wi-Fi"
             ip_address = None
             subnet_mask = None
+            lines_left = 0
             
-            for i, line in enumerate(lines):
+            # Get network interface info using ipconfig
+            for line in self._stream_command(['ipconfig'], timeout=10):
                 if "Wireless LAN adapter Wi-Fi" in line or "Ethernet adapter Ethernet" in line:
                     # Look for IP and subnet mask in following lines
-                    for j in range(i, min(i+10, len(lines))):
-                        if "IPv4 Address" in lines[j]:
-                            ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', lines[j])
-                            if ip_match:
-                                ip_address = ip_match.group(1)
-                        elif "Subnet Mask" in lines[j]:
-                            mask_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', lines[j])
-                            if mask_match:
-                                subnet_mask = mask_match.group(1)
+                    lines_left = 10
+                elif line[:1].strip():
+                    # Unindented text is the next adapter's header; skip its section
+                    lines_left = 0
+                
+                if lines_left:
+                    lines_left -= 1
+                    if "IPv4 Address" in line:
+                        ip_match = _WIN_IPV4_RE.search(line)
+                        if ip_match:
+                            ip_address = ip_match.group(1)
+                    elif "Subnet Mask" in line:
+                        mask_match = _WIN_IPV4_RE.search(line)
+                        if mask_match:
+                            subnet_mask = mask_match.group(1)
+                    
+                    if ip_address and subnet_mask:
+                        break
             
             if ip_address and subnet_mask:
                 network_range = self._calculate_network_range(ip_address, subnet_mask)
@@ -61,36 +167,74 @@ class Config:
             'subnet_mask': '255.255.255.0'
         }
     
+    def _detect_windows_network_psutil(self):
+        """Detect network info on Windows using psutil (no subprocess)"""
+        import psutil
+        
+        stats = psutil.net_if_stats()
+        best = None
+        for name, addrs in psutil.net_if_addrs().items():
+            # Same adapters the ipconfig parser looks for, Wi-Fi first; this skips
+            # Hyper-V/WSL "vEthernet (...)" switches and VPN "Ethernet N" adapters
+            if name == "Wi-Fi" or name.startswith("Wi-Fi "):
+                rank = 0
+            elif name == "Ethernet":
+                rank = 1
+            else:
+                continue
+            if name in stats and not stats[name].isup:
+                continue
+            if best is not None and best[0] <= rank:
+                continue
+            
+            for addr in addrs:
+                # 169.254.x.x means DHCP failed on this adapter
+                if addr.family == socket.AF_INET and addr.netmask and not addr.address.startswith('169.254.'):
+                    best = (rank, {
+                        'interface': name,
+                        'network_range': self._calculate_network_range(addr.address, addr.netmask),
+                        'local_ip': addr.address,
+                        'subnet_mask': addr.netmask
+                    })
+                    break
+        return best[1] if best else None
+    
     def _detect_linux_network(self):
         """Detect network info on Linux"""
+        try:
+            network_info = self._detect_linux_network_netlink()
+            if network_info:
+                return network_info
+        except ImportError:
+            pass  # Fall back to parsing ip command output
+        except Exception as e:
+            print(f"Linux network detection error: {e}")
+        
         try:
             # Try to get default interface
-            result = subprocess.run(['ip', 'route'], capture_output=True, text=True, timeout=5)
-            lines = result.stdout.split('\n')
-            
-            for line in lines:
-                if 'default' in line:
-                    parts = line.split()
-                    if len(parts) >= 5:
-                        interface = parts[4]
-                        break
-            else:
-                interface = "wlan0"  # Default fallback
+            interface = "wlan0"  # Default fallback
+            for line in self._stream_command(['ip', 'route'], timeout=5):
+                default_match = _LIN_DEFAULT_DEV_RE.match(line)
+                if default_match:
+                    interface = default_match.group(1)
+                    break
             
             # Get IP and network info for the interface
-            result = subprocess.run(['ip', 'addr', 'show', interface], capture_output=True, text=True, timeout=5)
-            ip_match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)/(\d+)', result.stdout)
+            ip_match = None
+            for line in self._stream_command(['ip', 'addr', 'show', interface], timeout=5):
+                ip_match = _LIN_INET_RE.search(line)
+                if ip_match:
+                    break
             
             if ip_match:
                 ip_address = ip_match.group(1)
-                cidr = ip_match.group(2)
-                network_range = f"{'.'.join(ip_address.split('.')[:3])}.0/{cidr}"
+                subnet_mask = self._cidr_to_mask(int(ip_match.group(2)))
                 
                 return {
                     'interface': interface,
-                    'network_range': network_range,
+                    'network_range': self._calculate_network_range(ip_address, subnet_mask),
                     'local_ip': ip_address,
-                    'subnet_mask': self._cidr_to_mask(int(cidr))
+                    'subnet_mask': subnet_mask
                 }
         except Exception as e:
             print(f"Linux network detection error: {e}")
@@ -103,20 +247,49 @@ class Config:
             'subnet_mask': '255.255.255.0'
         }
     
-    def _calculate_network_range(self, ip_address, subnet_mask):
-        """Calculate network range from IP and subnet mask"""
-        try:
-            ip_parts = [int(x) for x in ip_address.split('.')]
-            mask_parts = [int(x) for x in subnet_mask.split('.')]
+    def _detect_linux_network_netlink(self):
+        """Detect network info on Linux using netlink via pyroute2 (no subprocess)"""
+        from pyroute2 import IPRoute
+        
+        with IPRoute() as ipr:
+            default_routes = ipr.get_default_routes(family=socket.AF_INET)
+            if not default_routes:
+                return None
             
-            network_parts = []
-            for i in range(4):
-                network_parts.append(ip_parts[i] & mask_parts[i])
+            index = default_routes[0].get_attr('RTA_OIF')
+            links = ipr.get_links(index)
+            addrs = ipr.get_addr(index=index, family=socket.AF_INET)
+            if not links or not addrs:
+                return None
             
-            # Count CIDR bits
-            cidr = bin(int.from_bytes(mask_parts, 'big')).count('1')
+            interface = links[0].get_attr('IFLA_IFNAME')
+            ip_address = addrs[0].get_attr('IFA_ADDRESS')
+            subnet_mask = self._cidr_to_mask(addrs[0]['prefixlen'])
             
-            return f"{'.'.join(map(str, network_parts))}/{cidr}"
+            return {
+                'interface': interface,
+                'network_range': self._calculate_network_range(ip_address, subnet_mask),
+                'local_ip': ip_address,
+                'subnet_mask': subnet_mask
+            }
+    
+    def _stream_command(self, args, timeout):
+        """Yield a command's output line by line, killing it if it runs past the timeout"""
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+            timer = threading.Timer(timeout, proc.kill)
+            timer.start()
+            try:
+                yield from proc.stdout  # pyright: ignore[reportOptionalIterable]
+            finally:
+                timer.cancel()
+                # Callers stop reading once they have what they need
+                if proc.poll() is None:
+                    proc.kill()
+    
+    def _calculate_network_range(self, ip_address, subnet_mask):
+        """Calculate network range from IP and subnet mask"""
+        try:
+            return str(ipaddress.IPv4Network(f"{ip_address}/{subnet_mask}", strict=False))
         except:
             # Fallback calculation
             network_prefix = '.'.join(ip_address.split('.')[:-1])
@@ -124,53 +297,72 @@ class Config:
     
     def _cidr_to_mask(self, cidr):
         """Convert CIDR to subnet mask"""
-        mask = (0xffffffff >> (32 - cidr)) << (32 - cidr)
-        return '.'.join([str((mask >> (24 - i * 8)) & 0xff) for i in range(4)])
+        return str(ipaddress.IPv4Network(f"0.0.0.0/{cidr}").netmask)
     
     @property
     def NETWORK_INTERFACE(self):
-        return self._network_info['interface']
+        return self._get_network_info()['interface']
     
     @property
     def NETWORK_RANGE(self):
-        return self._network_info['network_range']
+        return self._get_network_info()['network_range']
     
     @property
     def LOCAL_IP(self):
-        return self._network_info['local_ip']
+        return self._get_network_info()['local_ip']
     
     # Other configuration settings
     DEFAULT_TIME_LIMIT = 120  # 2 hours default
     DISCONNECT_MESSAGE = "Your WiFi time is up. Please disconnect now."
     BLACKLIST_FILE = "blacklist.json"
+    NETWORK_CACHE_FILE = "network_cache.json"
+    NETWORK_CACHE_TTL = 60  # seconds between IP binding checks
     SCAN_INTERVAL = 30
+    ARP_IDLE_TIMEOUT = 0.5  # seconds without new ARP replies before a scan ends early
+    USE_NSLOOKUP = False  # fall back to spawning nslookup when reverse DNS fails
+    HOSTNAME_CACHE_TTL = 300  # seconds before a resolved hostname is looked up again
+    HOSTNAME_CACHE_SIZE = 1024
+    BLOCKLIST_RULE_NAME = "Block_WiFi_Manager_ALL"
     
     def load_blacklist(self):
-        """Load blacklist from file"""
+        """Load blacklist from file, reusing the last result if the file hasn't changed"""
         try:
-            if os.path.exists('blacklist.json'):
-                with open('blacklist.json', 'r') as f:
-                    return json.load(f)
+            if os.path.exists(self.BLACKLIST_FILE):
+                mtime = os.stat(self.BLACKLIST_FILE).st_mtime
+                if mtime == self._blacklist_mtime:
+                    return self._blacklist_cache
+                with open(self.BLACKLIST_FILE, 'rb') as f:
+                    self._blacklist_cache = _loads(f.read())
+                self._blacklist_mtime = mtime
+                return self._blacklist_cache
         except Exception as e:
             print(f"Error loading blacklist: {e}")
         return {}
         
     def save_blacklist(self, blacklist):
         """Save blacklist to file"""
-        with open('blacklist.json', 'w') as f:
-            json.dump(blacklist, f, indent=4)
+        # Write to a temp file and swap it in so a crash can't leave a half-written blacklist
+        tmp_file = self.BLACKLIST_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(_dumps(blacklist))
+        os.replace(tmp_file, self.BLACKLIST_FILE)
+        self._blacklist_cache = blacklist
+        self._blacklist_mtime = os.stat(self.BLACKLIST_FILE).st_mtime
             
     def block_ip_windows(self, ip_address):
         """Block an IP address using Windows Firewall"""
         try:
             rule_name = f"Block_WiFi_Manager_{ip_address}"
+            # Standalone netsh processes rather than the notifier's netsh helper, so
+            # force_disconnect_windows can overlap them with the helper's commands
+            
             # Delete existing rule if it exists
-            subprocess.run(
+            run_command(
                 ['netsh', 'advfirewall', 'firewall', 'delete', 'rule', f'name="{rule_name}"'],
                 capture_output=True, text=True
             )
             # Add new block rule
-            subprocess.run([
+            run_command([
                 'netsh', 'advfirewall', 'firewall', 'add', 'rule',
                 f'name="{rule_name}"',
                 'dir=out',
@@ -184,11 +376,45 @@ class Config:
             print(f"Failed to block IP {ip_address}: {e}")
             return False
 
+    def sync_blocklist_windows(self, ip_addresses):
+        """Block all given IPs with a single Windows Firewall rule"""
+        ips = frozenset(ip for ip in ip_addresses if ip)
+        if ips == self._synced_blocklist:
+            return True
+        
+        try:
+            rule_name = self.BLOCKLIST_RULE_NAME
+            # Replace the whole rule in one go instead of one rule per IP
+            run_command(
+                ['netsh', 'advfirewall', 'firewall', 'delete', 'rule', f'name="{rule_name}"'],
+                capture_output=True, text=True
+            )
+            if ips:
+                result = run_command([
+                    'netsh', 'advfirewall', 'firewall', 'add', 'rule',
+                    f'name="{rule_name}"',
+                    'dir=out',
+                    'action=block',
+                    f'remoteip={",".join(sorted(ips))}',
+                    'enable=yes',
+                    'profile=any'
+                ], capture_output=True, text=True)
+                if result.returncode != 0:
+                    # Leave the synced set alone so the next call retries
+                    print(f"Failed to sync blocklist: {result.stdout.strip() or result.stderr.strip()}")
+                    self._synced_blocklist = None
+                    return False
+            self._synced_blocklist = ips
+            return True
+        except Exception as e:
+            print(f"Failed to sync blocklist: {e}")
+            return False
+
     def unblock_ip_windows(self, ip_address):
         """Unblock an IP address in Windows Firewall"""
         try:
             rule_name = f"Block_WiFi_Manager_{ip_address}"
-            subprocess.run(
+            run_command(
                 ['netsh', 'advfirewall', 'firewall', 'delete', 'rule', f'name="{rule_name}"'],
                 capture_output=True, text=True
             )
@@ -1,97 +1,163 @@
 import time
+import platform
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, timedelta
 from config import config
 
+_IS_WINDOWS = platform.system() == "Windows"
+
+@dataclass
+class Device:
+    """A device found by a network scan"""
+    __slots__ = ('ip', 'mac', 'hostname')
+    ip: str
+    mac: str
+    hostname: str
+
+@lru_cache(maxsize=4096)
+def _format_duration(seconds):
+    """Format whole seconds as HH:MM:SS"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    seconds = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
 class DeviceManager:
+    ACTIVE_WINDOW = 300  # seconds since last_seen before a device is OFFLINE
+    
     def __init__(self):
         self.devices = {}
         self.blacklist = config.load_blacklist()
+        # Membership is all the scan path needs; rebuilt whenever the blacklist changes
+        self._blacklist_macs = frozenset(self.blacklist)
         self.connection_times = {}
+        # Timestamps are monotonic; this maps them back to wall-clock time for display
+        self._wall_clock_offset = time.time() - time.monotonic()
+        self._row_cache = {}
     
     def update_device(self, device_info):
-        """Update device information and track connection time"""
-        mac = device_info['mac']
-        current_time = time.time()
+        """Update device information from a scanned Device and track connection time"""
+        mac = device_info.mac
+        current_time = time.monotonic()
         
         if mac not in self.connection_times:
             self.connection_times[mac] = current_time
         
-        self.devices[mac] = {
-            **device_info,
-            'first_seen': self.connection_times[mac],
-            'last_seen': current_time,
-            'connection_duration': current_time - self.connection_times[mac],
-            'is_blacklisted': mac in self.blacklist
-        }
+        first_seen = self.connection_times[mac]
+        device = self.devices.get(mac)
+        if device is None:
+            # first_seen never changes, so format it only once per device
+            device = self.devices[mac] = {
+                'first_seen': first_seen,
+                'first_seen_str': datetime.fromtimestamp(first_seen + self._wall_clock_offset).strftime('%Y-%m-%d %H:%M:%S')
+            }
+        
+        # Update the existing record in place rather than rebuilding it every scan
+        device['ip'] = device_info.ip
+        device['mac'] = mac
+        device['hostname'] = device_info.hostname
+        device['last_seen'] = current_time
+        device['connection_duration'] = current_time - first_seen
+        device['is_blacklisted'] = mac in self._blacklist_macs
     
     def get_all_devices(self):
         """Get all devices with formatted information and status"""
         formatted_devices = []
-        current_time = time.time()
+        # Devices seen after this point are active (e.g., within last 5 minutes)
+        active_cutoff = time.monotonic() - self.ACTIVE_WINDOW
         
         for mac, info in self.devices.items():
-            # Determine status based on last_seen timestamp (e.g., active within last 5 minutes)
-            status = "ACTIVE" if (current_time - info['last_seen']) < 300 else "OFFLINE"
+            status = "ACTIVE" if info['last_seen'] > active_cutoff else "OFFLINE"
+            
+            # Reuse the formatted row if the device hasn't been updated since last time
+            key = (info['last_seen'], status)
+            cached = self._row_cache.get(mac)
+            if cached and cached[0] == key:
+                formatted_devices.append(cached[1])
+                continue
             
-            formatted_devices.append({
+            row = {
                 'mac': mac,
                 'ip': info['ip'],
                 'hostname': info['hostname'],
                 'connection_duration': self.format_duration(info['connection_duration']),
                 'is_blacklisted': info['is_blacklisted'],
-                'first_seen': datetime.fromtimestamp(info['first_seen']).strftime('%Y-%m-%d %H:%M:%S'),
+                'first_seen': info['first_seen_str'],
                 'status': status
-            })
+            }
+            self._row_cache[mac] = (key, row)
+            formatted_devices.append(row)
             
         return formatted_devices
     
     def format_duration(self, seconds):
         """Format duration in human-readable format"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return _format_duration(int(seconds))
     
     def blacklist_device(self, mac_address, reason="Manual blacklist"):
         """Add device to blacklist and block its IP"""
         # Get the device's IP before adding to blacklist
-        device_ip = None
-        for dev_mac, info in self.devices.items():
-            if dev_mac == mac_address:
-                device_ip = info.get('ip')
-                break
+        info = self.devices.get(mac_address)
+        device_ip = info.get('ip') if info else None
         
         self.blacklist[mac_address] = {
             'timestamp': datetime.now().isoformat(),
             'reason': reason,
             'ip': device_ip
         }
+        self._blacklist_macs = frozenset(self.blacklist)
         config.save_blacklist(self.blacklist)
         
         # Block the device's IP in Windows Firewall
-        if device_ip and platform.system() == "Windows":
-            config.block_ip_windows(device_ip)
+        if _IS_WINDOWS:
+            config.sync_blocklist_windows(self.get_blocked_ips())
         
         print(f"Device {mac_address} added to blacklist and blocked")
     
     def remove_from_blacklist(self, mac_address):
         """Remove device from blacklist and unblock its IP"""
         if mac_address in self.blacklist:
-            # Get the IP before removing from blacklist
-            device_ip = self.blacklist[mac_address].get('ip')
+            # IPs the device may have per-IP rules for from force disconnects
+            device_ips = {self.blacklist[mac_address].get('ip')}
+            info = self.devices.get(mac_address)
+            if info:
+                device_ips.add(info.get('ip'))
+            device_ips.discard(None)
             
             # Remove from blacklist
             del self.blacklist[mac_address]
+            self._blacklist_macs = frozenset(self.blacklist)
             config.save_blacklist(self.blacklist)
             
             # Unblock the IP in Windows Firewall
-            if device_ip and platform.system() == "Windows":
-                config.unblock_ip_windows(device_ip)
+            if _IS_WINDOWS:
+                config.sync_blocklist_windows(self.get_blocked_ips())
+                for ip in device_ips:
+                    config.unblock_ip_windows(ip)
             
             print(f"Device {mac_address} removed from blacklist and unblocked")
         else:
             print(f"Device {mac_address} not found in blacklist")
     
+    def get_hostname_for_mac(self, mac_address, ip_address):
+        """Get the known hostname for a device, if it's still at the same IP"""
+        info = self.devices.get(mac_address)
+        if info and info.get('ip') == ip_address and info.get('hostname') not in (None, "Unknown"):
+            return info['hostname']
+        return None
+    
+    def get_blocked_ips(self):
+        """Get all IPs that should be blocked for blacklisted devices"""
+        ips = set()
+        for mac, entry in self.blacklist.items():
+            if entry.get('ip'):
+                ips.add(entry['ip'])
+            # The device may have picked up a new IP since it was blacklisted
+            if mac in self.devices and self.devices[mac].get('ip'):
+                ips.add(self.devices[mac]['ip'])
+        return ips
+    
     def check_time_limit(self, mac_address, time_limit_minutes=config.DEFAULT_TIME_LIMIT):
         """Check if device has exceeded time limit"""
         if mac_address in self.devices:
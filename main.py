@@ -1,27 +1,66 @@
-import time
 import json
+import logging
 import os
 import platform
+import signal
+import sys
+import threading
 from colorama import Fore, Style, init
 from wifi_scanner import WiFiScanner
-from device_manager import DeviceManager
 from notification_sender import NotificationSender
 from config import config
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
+_IS_WINDOWS = platform.system() == "Windows"
+
+# The menu never changes, so build it once
+_MENU_TEXT = "\n".join([
+    f"\n{Fore.GREEN}{'WiFi Manager - Windows Edition':^50}",
+    f"{Fore.GREEN}{'='*50}",
+    f"{Fore.YELLOW}1. Scan connected devices",
+    f"{Fore.YELLOW}2. Blacklist device",
+    f"{Fore.YELLOW}3. Remove from blacklist",
+    f"{Fore.YELLOW}4. Send message to device",
+    f"{Fore.YELLOW}5. Disconnect device (Admin required)",
+    f"{Fore.YELLOW}6. Auto monitor mode",
+    f"{Fore.YELLOW}7. View blacklist",
+    f"{Fore.YELLOW}8. Network Info",
+    f"{Fore.YELLOW}9. Exit",
+    f"{Fore.GREEN}{'-'*50}"
+])
+_ADMIN_OK = f"{Fore.GREEN}✓ Running with Administrator privileges"
+_ADMIN_WARN = f"{Fore.YELLOW}⚠ Some features require Administrator privileges"
+
 class WiFiManager:
     def __init__(self):
         self.scanner = WiFiScanner()
-        self.device_manager = DeviceManager()
+        # Share the scanner's device manager so blacklist changes and scan results stay in sync
+        self.device_manager = self.scanner.device_manager
         self.notification_sender = NotificationSender()
         self.running = False
+        self._is_admin = None
+        self._network_changed = threading.Event()
+        self._stop = threading.Event()
+        self._change_watcher = None
+        
+        # Pre-built status cells for the device table
+        self._status_blocked = f"{Fore.RED}{'BLOCKED':<10}"
+        self._status_active = f"{Fore.GREEN}{'ACTIVE':<10}"
+        self._status_offline = f"{Fore.YELLOW}{'OFFLINE':<10}"
     
     def check_admin_privileges(self):
         """Check if running with admin privileges"""
+        # Privileges can't change while the process runs, so check only once
+        if self._is_admin is None:
+            self._is_admin = self._detect_admin_privileges()
+        return self._is_admin
+    
+    def _detect_admin_privileges(self):
+        """Query the OS for admin privileges"""
         try:
-            if platform.system() == "Windows":
+            if _IS_WINDOWS:
                 import ctypes
                 return ctypes.windll.shell32.IsUserAnAdmin()
             else:
@@ -31,58 +70,46 @@ class WiFiManager:
     
     def display_network_info(self):
         """Display detected network information"""
-        print(f"\n{Fore.CYAN}{'Detected Network Configuration':^50}")
-        print(f"{Fore.CYAN}{'='*50}")
-        print(f"{Fore.YELLOW}Interface:{Fore.WHITE} {config.NETWORK_INTERFACE}")
-        print(f"{Fore.YELLOW}Network Range:{Fore.WHITE} {config.NETWORK_RANGE}")
-        print(f"{Fore.YELLOW}Local IP:{Fore.WHITE} {config.LOCAL_IP}")
-        print(f"{Fore.CYAN}{'-'*50}")
+        print("\n".join([
+            f"\n{Fore.CYAN}{'Detected Network Configuration':^50}",
+            f"{Fore.CYAN}{'='*50}",
+            f"{Fore.YELLOW}Interface:{Fore.WHITE} {config.NETWORK_INTERFACE}",
+            f"{Fore.YELLOW}Network Range:{Fore.WHITE} {config.NETWORK_RANGE}",
+            f"{Fore.YELLOW}Local IP:{Fore.WHITE} {config.LOCAL_IP}",
+            f"{Fore.CYAN}{'-'*50}"
+        ]))
     
     def display_devices(self, devices):
         """Display connected devices in a formatted table"""
         if not devices:
             print(f"{Fore.YELLOW}No devices found on the network.")
             return
-            
-        print(f"\n{Fore.CYAN}{'Connected Devices':^80}")
-        print(f"{Fore.CYAN}{'='*80}")
-        print(f"{Fore.YELLOW}{'#':<3} {'Hostname':<20} {'IP Address':<15} {'MAC Address':<17} {'Duration':<12} {'Status':<10}")
-        print(f"{Fore.CYAN}{'-'*80}")
+        
+        # Build the whole table and write it in one go
+        rows = [
+            f"\n{Fore.CYAN}{'Connected Devices':^80}",
+            f"{Fore.CYAN}{'='*80}",
+            f"{Fore.YELLOW}{'#':<3} {'Hostname':<20} {'IP Address':<15} {'MAC Address':<17} {'Duration':<12} {'Status':<10}",
+            f"{Fore.CYAN}{'-'*80}"
+        ]
         
         for i, device in enumerate(devices, 1):
             if device['is_blacklisted']:
-                status_color = Fore.RED
-                status_text = "BLOCKED"
+                status = self._status_blocked
             elif device['status'] == 'ACTIVE':
-                status_color = Fore.GREEN
-                status_text = "ACTIVE"
+                status = self._status_active
             else:
-                status_color = Fore.YELLOW
-                status_text = "OFFLINE"
+                status = self._status_offline
 
-            print(f"{Fore.WHITE}{i:<3} {device['hostname'][:19]:<20} {device['ip']:<15} {device['mac']:<17} "
-                  f"{device['connection_duration']:<12} {status_color}{status_text:<10}")
+            rows.append(f"{Fore.WHITE}{i:<3} {device['hostname'][:19]:<20} {device['ip']:<15} {device['mac']:<17} "
+                        f"{device['connection_duration']:<12} {status}")
+        
+        sys.stdout.write("\n".join(rows) + "\n")
     
     def show_menu(self):
         """Display main menu"""
-        print(f"\n{Fore.GREEN}{'WiFi Manager - Windows Edition':^50}")
-        print(f"{Fore.GREEN}{'='*50}")
-        print(f"{Fore.YELLOW}1. Scan connected devices")
-        print(f"{Fore.YELLOW}2. Blacklist device")
-        print(f"{Fore.YELLOW}3. Remove from blacklist")
-        print(f"{Fore.YELLOW}4. Send message to device")
-        print(f"{Fore.YELLOW}5. Disconnect device (Admin required)")
-        print(f"{Fore.YELLOW}6. Auto monitor mode")
-        print(f"{Fore.YELLOW}7. View blacklist")
-        print(f"{Fore.YELLOW}8. Network Info")
-        print(f"{Fore.YELLOW}9. Exit")
-        print(f"{Fore.GREEN}{'-'*50}")
-        
-        # Show admin status
-        if self.check_admin_privileges():
-            print(f"{Fore.GREEN}✓ Running with Administrator privileges")
-        else:
-            print(f"{Fore.YELLOW}⚠ Some features require Administrator privileges")
+        # Show menu and admin status in a single write
+        print(f"{_MENU_TEXT}\n{_ADMIN_OK if self.check_admin_privileges() else _ADMIN_WARN}")
     
     def blacklist_device_interactive(self):
         """Interactive blacklist device"""
@@ -159,7 +186,9 @@ class WiFiManager:
             
             if 1 <= choice <= len(devices):
                 device = devices[choice-1]
-                success = self.notification_sender.disconnect_device(device['mac'], device['ip'])
+                success = self.notification_sender.disconnect_device(
+                    device['mac'], device['ip'], firewall_block=not device['is_blacklisted']
+                )
                 
                 if success:
                     print(f"{Fore.GREEN}Disconnected {device['ip']}!")
@@ -193,25 +222,37 @@ class WiFiManager:
         print(f"\n{Fore.CYAN}Starting auto-monitor mode. Press Ctrl+C to stop...")
         print(f"{Fore.YELLOW}Blacklisted devices will be automatically blocked.")
         
+        # Rescan as soon as the network changes instead of only on the timer
+        if self._change_watcher is None:
+            self._change_watcher = self.scanner.subscribe_changes(self._network_changed.set)
+        
+        # Ctrl+C sets the stop event so every wait below returns immediately
+        self._stop.clear()
+        previous_handler = signal.signal(signal.SIGINT, self._request_stop)
+        
         try:
-            while True:
-                # Clear screen for better visibility
-                os.system('cls' if os.name == 'nt' else 'clear')
+            while not self._stop.is_set():
+                # Clear screen for better visibility (colorama translates this on Windows)
+                print('\x1b[2J\x1b[H', end='')
                 
                 # Get and display devices
                 print(f"{Fore.CYAN}Scanning network...")
                 devices = self.scanner.get_connected_devices()
+                # Ignore changes caused by our own scan; a Ctrl+C from here on sets
+                # the event again, and one during the scan is caught just below
+                self._network_changed.clear()
+                if self._stop.is_set():
+                    break
                 self.display_devices(devices)
                 
+                # Ensure blacklisted IPs are blocked in Windows Firewall (no-op if unchanged)
+                if _IS_WINDOWS:
+                    config.sync_blocklist_windows(self.device_manager.get_blocked_ips())
+                
                 # Check for blacklisted devices and block them
-                blocked_count = 0
                 for device in devices:
                     if device['is_blacklisted'] and device['status'] == 'ACTIVE':
                         print(f"{Fore.RED}Blocking blacklisted device: {device['ip']} ({device['mac']})")
-                        if platform.system() == "Windows":
-                            # Ensure the IP is blocked in Windows Firewall
-                            config.block_ip_windows(device['ip'])
-                            blocked_count += 1
                         
                         # Optional: Send disconnect message
                         try:
@@ -223,35 +264,49 @@ class WiFiManager:
                             print(f"{Fore.YELLOW}Could not send notification to {device['ip']}: {e}")
                         if self.check_admin_privileges():
                             print(f"{Fore.RED}Disconnecting {device['ip']} in 5 seconds...")
-                            time.sleep(5)
-                            self.notification_sender.disconnect_device(device['mac'], device['ip'])
+                            if self._stop.wait(5):
+                                break
+                            # The blocklist sync above already covers its IP in the firewall
+                            self.notification_sender.disconnect_device(device['mac'], device['ip'], firewall_block=False)
                         else:
                             print(f"{Fore.YELLOW}Admin rights needed to disconnect automatically")
                 
-                print(f"{Fore.CYAN}Waiting {config.SCAN_INTERVAL} seconds until next scan...")
-                time.sleep(config.SCAN_INTERVAL)
-                
-        except KeyboardInterrupt:
-            print(f"{Fore.YELLOW}Auto monitor mode stopped")
+                print(f"{Fore.CYAN}Waiting up to {config.SCAN_INTERVAL} seconds until next scan...")
+                if self._network_changed.wait(config.SCAN_INTERVAL) and not self._stop.is_set():
+                    print(f"{Fore.CYAN}Network change detected, rescanning...")
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        
+        print(f"{Fore.YELLOW}Auto monitor mode stopped")
+    
+    def _request_stop(self, signum, frame):
+        """SIGINT handler for auto-monitor mode"""
+        self._stop.set()
+        # Wake up the wait for the next scan
+        self._network_changed.set()
     
     def view_blacklist(self):
         """Display blacklisted devices"""
-        blacklist = config.load_blacklist()
+        blacklist = self.device_manager.blacklist
         
         if not blacklist:
             print(f"{Fore.YELLOW}No devices in blacklist")
             return
         
-        print(f"\n{Fore.RED}{'Blacklisted Devices':^80}")
-        print(f"{Fore.RED}{'='*80}")
-        print(f"{Fore.YELLOW}{'MAC Address':<20} {'Reason':<30} {'Date':<20}")
-        print(f"{Fore.RED}{'-'*80}")
+        lines = [
+            f"\n{Fore.RED}{'Blacklisted Devices':^80}",
+            f"{Fore.RED}{'='*80}",
+            f"{Fore.YELLOW}{'MAC Address':<20} {'Reason':<30} {'Date':<20}",
+            f"{Fore.RED}{'-'*80}"
+        ]
         
         for mac, info in blacklist.items():
             timestamp = info.get('timestamp', 'N/A')
             if timestamp != 'N/A':
                 timestamp = timestamp[:19]  # Show only date and time
-            print(f"{Fore.WHITE}{mac:<20} {info.get('reason', 'N/A'):<30} {timestamp:<20}")
+            lines.append(f"{Fore.WHITE}{mac:<20} {info.get('reason', 'N/A'):<30} {timestamp:<20}")
+        
+        print("\n".join(lines))
     
     def run(self):
         """Main application loop"""
@@ -316,8 +371,12 @@ class WiFiManager:
                 print(f"\n{Fore.GREEN}Goodbye!")
             except Exception as e:
                 print(f"{Fore.RED}An error occurred: {e}")
+        
+        self.notification_sender.close()
 
 if __name__ == "__main__":
+    # Show scanner/notifier status messages; set DEBUG for per-scan details
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     manager = WiFiManager()
     
     try:
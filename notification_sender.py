@@ -1,27 +1,132 @@
+import asyncio
 import subprocess
+import logging
 import socket
+import threading
 import json
 import platform
+import queue
 import time
 import re
-from config import config  # Changed from 'from config import Config'
+from config import config, run_command  # Changed from 'from config import Config'
+
+logger = logging.getLogger(__name__)
+
+_IS_WINDOWS = platform.system() == "Windows"
+
+try:
+    import requests
+except ImportError:
+    requests = None
 
 class NotificationSender:
+    # Unknown command fed to netsh after each real one; it's echoed back once both have run
+    _NETSH_SENTINEL = "__wifi_manager_done__"
+    _NETSH_TIMEOUT = 15  # seconds to wait for a command's output before giving up on the helper
+    
     def __init__(self):
-        pass
+        self._udp_sock = None
+        self._http_session = None
+        self._netsh_proc = None
+        self._netsh_lines = None
+        self._netsh_hung = False
+        self._netsh_lock = threading.Lock()
+        
+        if requests is not None:
+            # Keep connections alive between notifications to the same device
+            self._http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            self._http_session.mount('http://', adapter)
+            self._http_session.mount('https://', adapter)
+    
+    def close(self):
+        """Release the pooled UDP socket, HTTP session and netsh helper"""
+        if self._udp_sock is not None:
+            self._udp_sock.close()
+            self._udp_sock = None
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+        with self._netsh_lock:
+            if self._netsh_proc is not None:
+                try:
+                    self._netsh_proc.stdin.write("exit\n")  # pyright: ignore[reportOptionalMemberAccess]
+                    self._netsh_proc.stdin.close()  # pyright: ignore[reportOptionalMemberAccess]
+                    self._netsh_proc.wait(timeout=5)
+                except Exception:
+                    self._netsh_proc.kill()
+                self._netsh_proc = None
+    
+    def _netsh_start(self):
+        """Start the long-lived netsh process and a thread that queues its output"""
+        self._netsh_proc = subprocess.Popen(
+            ['netsh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, text=True, close_fds=not _IS_WINDOWS
+        )
+        self._netsh_lines = queue.Queue()
+        threading.Thread(
+            target=self._netsh_pump, args=(self._netsh_proc.stdout, self._netsh_lines), daemon=True
+        ).start()
+    
+    def _netsh_kill(self):
+        """Kill the netsh helper so the next command starts a fresh one"""
+        if self._netsh_proc is not None:
+            self._netsh_proc.kill()
+        self._netsh_proc = None
+    
+    @staticmethod
+    def _netsh_pump(stream, lines):
+        """Move netsh output into a queue so reads can time out"""
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+    
+    def _netsh_run(self, args):
+        """Run a netsh command through a long-lived netsh process and return its output"""
+        with self._netsh_lock:
+            try:
+                if self._netsh_hung:
+                    raise OSError("netsh helper timed out earlier")
+                if self._netsh_proc is None or self._netsh_proc.poll() is not None:
+                    self._netsh_start()
+                proc = self._netsh_proc
+                proc.stdin.write(f"{' '.join(args)}\n{self._NETSH_SENTINEL}\n")  # pyright: ignore[reportOptionalMemberAccess]
+                proc.stdin.flush()  # pyright: ignore[reportOptionalMemberAccess]
+                
+                output = []
+                deadline = time.monotonic() + self._NETSH_TIMEOUT
+                while True:
+                    line = self._netsh_lines.get(timeout=max(0, deadline - time.monotonic()))  # pyright: ignore[reportOptionalMemberAccess]
+                    if line is None:
+                        raise OSError("netsh helper exited")
+                    if self._NETSH_SENTINEL in line:
+                        break
+                    output.append(line)
+                return ''.join(output)
+            except queue.Empty:
+                logger.warning("netsh helper timed out, running netsh commands directly from now on")
+                # Don't pay the timeout again on every command
+                self._netsh_hung = True
+                self._netsh_kill()
+            except OSError as e:
+                logger.debug("netsh helper unavailable, running command directly: %s", e)
+                self._netsh_kill()
+        
+        result = run_command(['netsh', *args], capture_output=True, text=True, timeout=self._NETSH_TIMEOUT)
+        return result.stdout
     
     def send_message(self, ip_address, message):
         """Send message to a device. Uses msg.exe on Windows for a popup."""
-        if platform.system() == "Windows":
+        if _IS_WINDOWS:
             return self.send_windows_popup(ip_address, message)
         else:
             # For non-Windows systems, fallback to old methods
             try:
-                print(f"Attempting to send UDP message to {ip_address}: {message}")
+                logger.debug("Attempting to send UDP message to %s: %s", ip_address, message)
                 self.send_udp_message(ip_address, message)
                 return True
             except Exception as e:
-                print(f"Failed to send message to {ip_address}: {e}")
+                logger.error("Failed to send message to %s: %s", ip_address, e)
                 return False
 
     def send_windows_popup(self, ip_address, message):
@@ -30,59 +135,64 @@ class NotificationSender:
             # The '*' sends the message to all sessions on the target machine.
             # You could also try to find a specific username if you know it.
             command = ['msg', '*', '/SERVER:' + ip_address, message]
-            result = subprocess.run(command, capture_output=True, text=True, timeout=10)
+            result = run_command(command, capture_output=True, text=True, timeout=10)
             if result.returncode == 0:
-                print(f"Successfully sent message to {ip_address}")
+                logger.debug("Successfully sent message to %s", ip_address)
                 return True
             else:
-                print(f"Failed to send message to {ip_address}. Error: {result.stderr}")
+                logger.error("Failed to send message to %s. Error: %s", ip_address, result.stderr)
                 return False
         except FileNotFoundError:
-            print("Error: 'msg.exe' not found. This command is not available on this version of Windows.")
+            logger.error("'msg.exe' not found. This command is not available on this version of Windows.")
             return False
         except subprocess.TimeoutExpired:
-            print(f"Timeout expired when trying to send message to {ip_address}")
+            logger.error("Timeout expired when trying to send message to %s", ip_address)
             return False
         except Exception as e:
-            print(f"An error occurred while sending message to {ip_address}: {e}")
+            logger.error("An error occurred while sending message to %s: %s", ip_address, e)
             return False
     
     def send_udp_message(self, ip_address, message, port=9999):
         """Send UDP message to device"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(2)
-            sock.sendto(message.encode(), (ip_address, port))
-            sock.close()
-            print(f"UDP message sent to {ip_address}:{port}")
+            # Reuse one socket for all messages instead of opening one per send
+            if self._udp_sock is None:
+                self._udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._udp_sock.settimeout(2)
+            self._udp_sock.sendto(message.encode(), (ip_address, port))
+            logger.debug("UDP message sent to %s:%s", ip_address, port)
         except Exception as e:
-            print(f"UDP message failed: {e}")
+            logger.error("UDP message failed: %s", e)
     
     def send_http_notification(self, ip_address, message, port=80):
         """Send HTTP notification (if device has web server)"""
+        if self._http_session is None:
+            logger.warning("requests module not installed. HTTP notifications are unavailable.")
+            return
+        
         try:
-            import requests
             payload = {'message': message, 'source': 'wifi_manager'}
-            response = requests.post(f"http://{ip_address}:{port}/", 
-                          json=payload, timeout=2)
-            print(f"HTTP notification sent to {ip_address}, status: {response.status_code}")
+            response = self._http_session.post(f"http://{ip_address}:{port}/", 
+                                               json=payload, timeout=2)
+            logger.debug("HTTP notification sent to %s, status: %s", ip_address, response.status_code)
         except requests.exceptions.RequestException as e:
             # This is expected for most devices
             pass
         except Exception as e:
-            print(f"HTTP notification failed: {e}")
+            logger.error("HTTP notification failed: %s", e)
     
-    def disconnect_device_windows(self, mac_address, ip_address):
+    def disconnect_device_windows(self, mac_address, ip_address, firewall_block=True):
         """Disconnect device on Windows using netsh"""
         try:
             # Method 1: Block via Windows Firewall
-            self.block_via_windows_firewall(ip_address)
+            if firewall_block:
+                self.block_via_windows_firewall(ip_address)
             
             # Method 2: Send deauth-like packets (limited on Windows)
-            print(f"Windows: Would disconnect {mac_address} via firewall rules")
+            logger.info("Windows: Would disconnect %s via firewall rules", mac_address)
             return True
         except Exception as e:
-            print(f"Windows disconnect failed: {e}")
+            logger.error("Windows disconnect failed: %s", e)
             return False
     
     def disconnect_device_linux(self, mac_address, ip_address):
@@ -94,72 +204,74 @@ class NotificationSender:
             # Method 2: Using iptables
             self.block_via_iptables(ip_address)
             
-            print(f"Linux: Disconnected device {mac_address}")
+            logger.info("Linux: Disconnected device %s", mac_address)
             return True
         except Exception as e:
-            print(f"Linux disconnect failed: {e}")
+            logger.error("Linux disconnect failed: %s", e)
             return False
             
-    def force_disconnect_windows(self, mac_address, ip_address):
+    def force_disconnect_windows(self, mac_address, ip_address, firewall_block=True):
         """Force disconnect a device using netsh and WiFi filters"""
         try:
-            # Convert MAC to format needed by netsh (dashes instead of colons)
-            mac_netsh = mac_address.replace(':', '-')
-            
-            print(f"Attempting to disconnect {ip_address} ({mac_address})...")
-            
-            # Block the device using Windows Firewall
-            config.block_ip_windows(ip_address)
-            
-            # Clear ARP cache to remove any existing entries
-            self.clear_arp_cache()
-            
-            # Try to get the WiFi interface name
-            result = subprocess.run(
-                ['netsh', 'wlan', 'show', 'interfaces'],
-                capture_output=True, text=True
-            )
-            
-            # Parse the interface name from the output
-            interface_name = None
-            for line in result.stdout.split('\n'):
-                if 'Name' in line and ':' in line:
-                    interface_name = line.split(':')[1].strip()
-                    break
-            
-            if interface_name:
-                # Disassociate the device using netsh
-                subprocess.run([
-                    'netsh', 'wlan', 'disconnect', 
-                    f'interface="{interface_name}"'
-                ], capture_output=True, text=True)
-                
-                # Add a filter to block the device by MAC
-                subprocess.run([
-                    'netsh', 'wlan', 'add', 'filter',
-                    'permission=denyall',
-                    f'macaddress={mac_netsh}',
-                    'networktype=infrastructure'
-                ], capture_output=True, text=True)
-                
-                print(f"Successfully disconnected and blocked {ip_address} ({mac_address})")
-                return True
-            else:
-                print("Could not determine WiFi interface name")
-                return False
-                
+            return asyncio.run(self._force_disconnect_windows_async(mac_address, ip_address, firewall_block))
         except Exception as e:
-            print(f"Error in force_disconnect_windows: {e}")
+            logger.error("Error in force_disconnect_windows: %s", e)
             return False
     
+    async def _force_disconnect_windows_async(self, mac_address, ip_address, firewall_block):
+        """Run the force-disconnect commands, overlapping the independent ones"""
+        # Convert MAC to format needed by netsh (dashes instead of colons)
+        mac_netsh = mac_address.replace(':', '-')
+        
+        logger.info("Attempting to disconnect %s (%s)...", ip_address, mac_address)
+        
+        # The firewall block runs its own netsh processes, so it overlaps the ARP
+        # flush and interface query, which take turns on the netsh helper
+        helper_steps = asyncio.to_thread(self._clear_arp_and_get_interfaces)
+        if firewall_block:
+            _, interfaces_output = await asyncio.gather(
+                asyncio.to_thread(config.block_ip_windows, ip_address),
+                helper_steps
+            )
+        else:
+            interfaces_output = await helper_steps
+        
+        # Parse the interface name from the output
+        interface_name = None
+        for line in interfaces_output.split('\n'):
+            if 'Name' in line and ':' in line:
+                interface_name = line.split(':')[1].strip()
+                break
+        
+        if not interface_name:
+            logger.warning("Could not determine WiFi interface name")
+            return False
+        
+        # Disassociate the device using netsh
+        self._netsh_run(['wlan', 'disconnect', f'interface="{interface_name}"'])
+        
+        # Add a filter to block the device by MAC
+        self._netsh_run([
+            'wlan', 'add', 'filter',
+            'permission=denyall',
+            f'macaddress={mac_netsh}',
+            'networktype=infrastructure'
+        ])
+        
+        logger.info("Successfully disconnected and blocked %s (%s)", ip_address, mac_address)
+        return True
+    
+    def _clear_arp_and_get_interfaces(self):
+        """Clear the ARP cache, then return the output of `netsh wlan show interfaces`"""
+        self.clear_arp_cache()
+        return self._netsh_run(['wlan', 'show', 'interfaces'])
+    
     def clear_arp_cache(self):
         """Clear the ARP cache to ensure fresh device detection"""
         try:
-            if platform.system() == "Windows":
-                # Clear ARP cache
-                subprocess.run(['arp', '-d', '*'], 
-                             capture_output=True, 
-                             text=True)
+            if _IS_WINDOWS:
+                # Clear ARP cache (same as `arp -d *`, without spawning arp.exe)
+                self._netsh_run(['interface', 'ip', 'delete', 'arpcache'])
                 
                 # Optional: Release and renew IP (uncomment if needed)
                 # subprocess.run(['ipconfig', '/release'], 
@@ -169,26 +281,28 @@ class NotificationSender:
                 #              capture_output=True, 
                 #              text=True)
                 
-                print("ARP cache cleared")
+                logger.debug("ARP cache cleared")
                 return True
             else:
                 # For Linux/Unix
-                subprocess.run(['ip', '-s', '-s', 'neigh', 'flush', 'all'],
-                             capture_output=True,
-                             text=True)
+                run_command(['ip', '-s', '-s', 'neigh', 'flush', 'all'],
+                            capture_output=True,
+                            text=True)
                 return True
         except Exception as e:
-            print(f"Error clearing ARP cache: {e}")
+            logger.error("Error clearing ARP cache: %s", e)
             return False
     
-    def disconnect_device(self, mac_address, ip_address):
+    def disconnect_device(self, mac_address, ip_address, firewall_block=True):
         """Disconnect a device from the network"""
-        if platform.system() == "Windows":
+        if _IS_WINDOWS:
+            # firewall_block=False skips the per-IP rule for blacklisted devices,
+            # whose IPs the Block_WiFi_Manager_ALL rule already covers
             # First try the force disconnect method
-            if self.force_disconnect_windows(mac_address, ip_address):
+            if self.force_disconnect_windows(mac_address, ip_address, firewall_block):
                 return True
             # Fall back to regular disconnect if force fails
-            return self.disconnect_device_windows(mac_address, ip_address)
+            return self.disconnect_device_windows(mac_address, ip_address, firewall_block)
         else:
             return self.disconnect_device_linux(mac_address, ip_address)
     
@@ -199,37 +313,39 @@ class NotificationSender:
             rule_name = f"Block_WiFi_Manager_{ip_address}"
             
             # Check if rule exists
-            check_cmd = f'netsh advfirewall firewall show rule name="{rule_name}"'
-            result = subprocess.run(check_cmd, shell=True, capture_output=True, text=True)
+            output = self._netsh_run(['advfirewall', 'firewall', 'show', 'rule', f'name={rule_name}'])
             
-            if "No rules match" in result.stdout:
+            if "No rules match" in output:
                 # Create new rule
-                block_cmd = (f'netsh advfirewall firewall add rule name="{rule_name}" '
-                           f'dir=in action=block remoteip={ip_address} '
-                           f'protocol=ANY enable=yes')
-                subprocess.run(block_cmd, shell=True, check=True)
-                print(f"Windows Firewall rule created to block {ip_address}")
+                self._netsh_run([
+                    'advfirewall', 'firewall', 'add', 'rule',
+                    f'name={rule_name}',
+                    'dir=in',
+                    'action=block',
+                    f'remoteip={ip_address}',
+                    'protocol=ANY',
+                    'enable=yes'
+                ])
+                logger.info("Windows Firewall rule created to block %s", ip_address)
             else:
-                print(f"Windows Firewall rule already exists for {ip_address}")
+                logger.debug("Windows Firewall rule already exists for %s", ip_address)
                 
-        except subprocess.CalledProcessError as e:
-            print(f"Windows Firewall command failed: {e}")
         except Exception as e:
-            print(f"Windows Firewall block failed: {e}")
+            logger.error("Windows Firewall block failed: %s", e)
     
     def block_via_arp(self, mac_address):
         """Block device using ARP table (Linux)"""
         try:
-            if platform.system() != "Windows":
-                subprocess.run(['arp', '-d', mac_address], check=True)
+            if not _IS_WINDOWS:
+                run_command(['arp', '-d', mac_address], check=True)
         except:
             pass
     
     def block_via_iptables(self, ip_address):
         """Block device using iptables (Linux)"""
         try:
-            if platform.system() != "Windows":
-                subprocess.run(['iptables', '-A', 'INPUT', '-s', ip_address, '-j', 'DROP'], check=True)
-                subprocess.run(['iptables', '-A', 'OUTPUT', '-d', ip_address, '-j', 'DROP'], check=True)
+            if not _IS_WINDOWS:
+                run_command(['iptables', '-A', 'INPUT', '-s', ip_address, '-j', 'DROP'], check=True)
+                run_command(['iptables', '-A', 'OUTPUT', '-d', ip_address, '-j', 'DROP'], check=True)
         except:
             pass
\ No newline at end of file
@@ -1,10 +1,32 @@
 import subprocess
+import logging
 import re
 import platform
 import socket
+import io
+import ipaddress
 import os
+import shutil
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from contextlib import contextmanager
+from functools import lru_cache
+from xml.etree import ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+_IS_WINDOWS = platform.system() == "Windows"
+
+@lru_cache(maxsize=8)
+def _arp_row_re(net_prefix):
+    """Regex capturing (ip, mac) from `arp -a` rows on the given network prefix"""
+    return re.compile(
+        rf'^\s*({re.escape(net_prefix)}\.\S+)\s+([0-9A-Fa-f]{{2}}(?:[:-][0-9A-Fa-f]{{2}}){{5}})(?=\s|$)',
+        re.MULTILINE
+    )
 
 @contextmanager
 def suppress_stderr():
@@ -19,97 +41,92 @@ def suppress_stderr():
 
 # Suppress scapy's warning about Wireshark's manuf file
 with suppress_stderr():
-    from scapy.all import ARP, Ether, srp, conf  # pyright: ignore[reportAttributeAccessIssue]
-from device_manager import DeviceManager
-from config import config
+    from scapy.all import ARP, Ether, AsyncSniffer, sendp, conf  # pyright: ignore[reportAttributeAccessIssue]
+from device_manager import Device, DeviceManager
+from config import config, run_command
 
-# Nmap module and availability
+# Nmap binary availability
 class NmapState:
     _available = False
-    _scanner = None
     
     @classmethod
     def initialize(cls):
-        try:
-            import nmap
-            try:
-                # Test if nmap is properly installed and accessible
-                cls._scanner = nmap.PortScanner()
-                cls._available = True
-            except Exception as e:
-                print(f"Nmap is installed but not working: {e}")
-                cls._available = False
-        except ImportError:
-            print("Nmap module not installed. Some features will be limited.")
-            cls._available = False
+        # Only look the binary up on PATH; nothing is spawned until the first scan
+        cls._available = shutil.which('nmap') is not None
+        if not cls._available:
+            logger.warning("Nmap not installed. Some features will be limited.")
     
     @classmethod
     def is_available(cls):
         return cls._available
     
-    @classmethod
-    def get_scanner(cls):
-        return cls._scanner
-    
     @classmethod
     def disable(cls):
         cls._available = False
-        cls._scanner = None
 
 # Initialize Nmap state
 NmapState.initialize()
 
 
+def _nmap_ping_scan(network_range, timeout=None):
+    """Ping-scan a range with nmap, returning (ip, mac, hostname) for each host up"""
+    if timeout is None:
+        # Give larger ranges (a /16 is 65536 addresses) proportionally longer
+        timeout = 30 + ipaddress.ip_network(network_range, strict=False).num_addresses * 0.02
+    result = run_command(['nmap', '-sn', '-oX', '-', network_range], capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors='replace').strip() or f"nmap exited with {result.returncode}")
+
+    hosts = []
+    for _, elem in ET.iterparse(io.BytesIO(result.stdout), events=('end',)):
+        if elem.tag != 'host':
+            continue
+
+        ip = mac = None
+        for address in elem.iter('address'):
+            if address.get('addrtype') == 'ipv4':
+                ip = address.get('addr')
+            elif address.get('addrtype') == 'mac':
+                mac = address.get('addr')
+
+        hostname = elem.find('hostnames/hostname')
+        if ip:
+            hosts.append((ip, mac, hostname.get('name') if hostname is not None else None))
+        elem.clear()
+
+    return hosts
+
+
 class WiFiScanner:
     def __init__(self):
         self.device_manager = DeviceManager()
-
-        # Initialize nmap only if available
-        if NmapState.is_available():
-            self.nm = NmapState.get_scanner()
-        else:
-            self.nm = None
+        self._hostname_cache = OrderedDict()
+        self._hostname_lock = threading.Lock()
 
         # Configure scapy for Windows
-        if platform.system() == "Windows":
+        if _IS_WINDOWS:
             conf.use_winpcapy = True  # pyright: ignore[reportAttributeAccessIssue]
 
-        print(f"Scanner initialized for network: {config.NETWORK_RANGE}")
-        print(f"Using interface: {config.NETWORK_INTERFACE}")
+        logger.info("Scanner initialized for network: %s", config.NETWORK_RANGE)
+        logger.info("Using interface: %s", config.NETWORK_INTERFACE)
 
     def get_windows_arp_table(self):
         """Get ARP table on Windows using arp command"""
         try:
-            result = subprocess.run(['arp', '-a'], capture_output=True, text=True, timeout=10)
-            devices = []
-
-            for line in result.stdout.split('\n'):
-                line = line.strip()
-                if not line or not line.startswith(config.NETWORK_RANGE.split('.')[0]):
-                    continue
-
-                parts = line.split()
-                if len(parts) < 2:
-                    continue
-
-                ip = parts[0]
-                mac = parts[1]
-
-                # Validate MAC address format
-                if not re.match(r'^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$', mac):
-                    continue
-
-                mac = mac.replace('-', ':').upper()
+            result = run_command(['arp', '-a'], capture_output=True, text=True, timeout=10)
+            candidates = []
+            row_re = _arp_row_re(config.NETWORK_RANGE.split('.')[0])
+
+            # One pass over the output picks out rows with a valid IP and MAC
+            for match in row_re.finditer(result.stdout):
+                ip = match.group(1)
+                mac = match.group(2).replace('-', ':').upper()
                 if self._is_valid_device(ip, mac):
-                    devices.append({
-                        'ip': ip,
-                        'mac': mac,
-                        'hostname': self.get_hostname(ip)
-                    })
+                    candidates.append((ip, mac))
 
-            return devices
+            return self._build_devices(candidates)
         except Exception as e:
-            print(f"Windows ARP table error: {e}")
+            logger.error("Windows ARP table error: %s", e)
             return []
 
     def _is_valid_device(self, ip, mac):
@@ -127,7 +144,7 @@ class WiFiScanner:
 
     def scan_arp(self):
         """Scan network using ARP requests"""
-        if platform.system() == "Windows":
+        if _IS_WINDOWS:
             return self.get_windows_arp_table()
 
         try:
@@ -135,27 +152,113 @@ class WiFiScanner:
             ether = Ether(dst="ff:ff:ff:ff:ff:ff")
             packet = ether / arp
 
-            result = srp(packet, timeout=3, verbose=0, iface=config.NETWORK_INTERFACE)[0]
+            replies = self._collect_arp_replies(packet)
 
-            devices = []
-            for sent, received in result:
-                if self._is_valid_device(received.psrc, received.hwsrc):
-                    devices.append({
-                        'ip': received.psrc,
-                        'mac': received.hwsrc,
-                        'hostname': self.get_hostname(received.psrc)
-                    })
+            candidates = []
+            for ip, mac in replies.items():
+                if self._is_valid_device(ip, mac):
+                    candidates.append((ip, mac))
 
-            return devices
+            return self._build_devices(candidates)
         except Exception as e:
-            print(f"ARP scan error: {e}")
+            logger.error("ARP scan error: %s", e)
             return []
 
+    def _build_devices(self, candidates):
+        """Build device entries from (ip, mac) pairs, resolving hostnames concurrently"""
+        # Devices we already know at the same IP keep their hostname
+        hostnames = {}
+        unresolved = []
+        for ip, mac in candidates:
+            hostname = self.device_manager.get_hostname_for_mac(mac, ip)
+            if hostname:
+                hostnames[ip] = hostname
+            else:
+                unresolved.append(ip)
+
+        hostnames.update(self._resolve_hostnames(unresolved))
+        return [Device(ip=ip, mac=mac, hostname=hostnames[ip]) for ip, mac in candidates]
+
+    def _resolve_hostnames(self, ips):
+        """Resolve hostnames for many IPs in parallel, reusing recent results"""
+        now = time.monotonic()
+        hostnames = {}
+        pending = []
+        with self._hostname_lock:
+            for ip in ips:
+                cached = self._hostname_cache.get(ip)
+                if cached and now - cached[0] < config.HOSTNAME_CACHE_TTL:
+                    self._hostname_cache.move_to_end(ip)
+                    hostnames[ip] = cached[1]
+                elif ip not in pending:
+                    pending.append(ip)
+
+        if pending:
+            # Lookups are I/O bound, so resolve them all at once
+            with ThreadPoolExecutor(max_workers=min(32, len(pending))) as executor:
+                resolved = list(zip(pending, executor.map(self.get_hostname, pending)))
+
+            with self._hostname_lock:
+                for ip, hostname in resolved:
+                    self._hostname_cache[ip] = (now, hostname)
+                    self._hostname_cache.move_to_end(ip)
+                    hostnames[ip] = hostname
+                # Evict least recently used entries beyond the size limit
+                while len(self._hostname_cache) > config.HOSTNAME_CACHE_SIZE:
+                    self._hostname_cache.popitem(last=False)
+
+        return hostnames
+
+    def _collect_arp_replies(self, packet, timeout=3):
+        """Send an ARP request and collect replies until they stop arriving"""
+        replies = {}
+        last_reply = [time.monotonic()]
+        started = threading.Event()
+
+        def on_packet(pkt):
+            if ARP in pkt and pkt[ARP].op == 2:  # is-at
+                replies[pkt[ARP].psrc] = pkt[ARP].hwsrc
+                last_reply[0] = time.monotonic()
+
+        sniffer = AsyncSniffer(prn=on_packet, store=False, iface=config.NETWORK_INTERFACE,
+                               started_callback=started.set)
+        sniffer.start()
+        try:
+            started.wait(1)
+            sendp(packet, verbose=0, iface=config.NETWORK_INTERFACE)
+
+            # Return as soon as replies go quiet instead of always waiting out the
+            # full timeout; a known-device count can't tell when a new one is still answering
+            start = time.monotonic()
+            while time.monotonic() - start < timeout:
+                time.sleep(0.05)
+                if replies and time.monotonic() - last_reply[0] > config.ARP_IDLE_TIMEOUT:
+                    break
+        finally:
+            sniffer.stop()
+
+        return dict(replies)
+
     def get_hostname(self, ip):
         """Get hostname"""
         try:
-            if platform.system() == "Windows":
-                result = subprocess.run(['nslookup', ip], capture_output=True, text=True, timeout=2)
+            return socket.gethostbyaddr(ip)[0]
+        except:
+            pass
+
+        # nslookup costs a process spawn per IP, so it's opt-in
+        if config.USE_NSLOOKUP:
+            hostname = self._nslookup_hostname(ip)
+            if hostname:
+                return hostname
+
+        return "Unknown"
+
+    def _nslookup_hostname(self, ip):
+        """Get hostname by running nslookup"""
+        try:
+            if _IS_WINDOWS:
+                result = run_command(['nslookup', ip], capture_output=True, text=True, timeout=2)
                 for line in result.stdout.split('\n'):
                     if 'Name:' in line:
                         hostname = line.split('Name:')[1].strip()
@@ -168,47 +271,36 @@ class WiFiScanner:
                         return line.split('=')[1].strip()
         except:
             pass
-
-        try:
-            return socket.gethostbyaddr(ip)[0]
-        except:
-            return "Unknown"
+        return None
 
     def scan_nmap(self):
         """Scan network using nmap"""
-        if not NmapState.is_available() or self.nm is None:
-            if not NmapState.is_available():
-                print("Nmap scanning is not available. Install python-nmap for better results.")
+        if not NmapState.is_available():
+            logger.debug("Nmap scanning is not available. Install nmap for better results.")
             return []
             
         try:
-            print(f"Scanning with nmap: {config.NETWORK_RANGE}")
-            self.nm.scan(hosts=config.NETWORK_RANGE, arguments='-sn')
+            logger.debug("Scanning with nmap: %s", config.NETWORK_RANGE)
             
-            devices = []
-            for host in self.nm.all_hosts():
-                if not self.nm[host]:
-                    continue
-                    
-                mac = self.nm[host]['addresses'].get('mac', 'Unknown')
-                if mac == 'Unknown':
+            candidates = []
+            for host, mac, _ in _nmap_ping_scan(config.NETWORK_RANGE):
+                if not mac:
                     continue
                     
                 mac = mac.upper()
                 if self._is_valid_device(host, mac):
-                    devices.append({
-                        'ip': host,
-                        'mac': mac,
-                        'hostname': self.get_hostname(host)
-                    })
+                    candidates.append((host, mac))
                     
-            return devices
+            return self._build_devices(candidates)
             
+        except subprocess.TimeoutExpired:
+            # A slow scan isn't a broken nmap; try again next time
+            logger.warning("Nmap scan of %s timed out", config.NETWORK_RANGE)
+            return []
         except Exception as e:
-            print(f"Nmap scan error: {e}")
+            logger.error("Nmap scan error: %s", e)
             # Disable Nmap for future scans if it fails
             NmapState.disable()
-            self.nm = None
             return []
 
     def scan_multiple_ranges(self):
@@ -226,59 +318,117 @@ class WiFiScanner:
             '172.16.0.0/24'
         ]
 
+        # Each range is an independent nmap run, so scan them all at once
+        unique_ranges = list(dict.fromkeys(common_ranges))
         all_devices = []
 
-        for network_range in common_ranges:
-            try:
-                print(f"Trying range: {network_range}")
-                self.nm.scan(hosts=network_range, arguments='-sn') # pyright: ignore[reportOptionalMemberAccess]
-
-                for host in self.nm.all_hosts(): # pyright: ignore[reportOptionalMemberAccess]
-                    if not self.nm[host]: # pyright: ignore[reportOptionalSubscript]
-                        continue
-                    mac = self.nm[host]['addresses'].get('mac', 'Unknown') # pyright: ignore[reportOptionalSubscript]
-
-                    if self._is_valid_device(host, mac):
-                        all_devices.append({
-                            'ip': host,
-                            'mac': mac,
-                            'hostname': self.nm[host].hostname() or "Unknown" # type: ignore
-                        })
-            except:
-                continue
+        with ThreadPoolExecutor(max_workers=len(unique_ranges)) as executor:
+            for devices in executor.map(self._scan_range, unique_ranges):
+                all_devices.extend(devices)
 
         return all_devices
 
+    def _scan_range(self, network_range):
+        """Ping-scan a single range with nmap"""
+        try:
+            logger.debug("Trying range: %s", network_range)
+
+            devices = []
+            for host, mac, hostname in _nmap_ping_scan(network_range):
+                mac = mac or 'Unknown'
+                if self._is_valid_device(host, mac):
+                    devices.append(Device(ip=host, mac=mac, hostname=hostname or "Unknown"))
+            return devices
+        except:
+            return []
+
+    def subscribe_changes(self, callback):
+        """Call callback from a background thread whenever the network changes"""
+        if _IS_WINDOWS:
+            target = self._watch_windows_changes
+        else:
+            target = self._watch_linux_changes
+        
+        thread = threading.Thread(target=target, args=(callback,), daemon=True)
+        thread.start()
+        return thread
+
+    def _watch_windows_changes(self, callback):
+        """Wait on IP address table changes using NotifyAddrChange"""
+        try:
+            import ctypes
+            notify_addr_change = ctypes.windll.iphlpapi.NotifyAddrChange  # pyright: ignore[reportAttributeAccessIssue]
+            
+            # With no handle/overlapped this blocks until the address table changes
+            while notify_addr_change(None, None) == 0:
+                callback()
+        except Exception as e:
+            logger.warning("Network change watcher stopped: %s", e)
+
+    def _watch_linux_changes(self, callback):
+        """Listen for new neighbours and address changes over netlink"""
+        try:
+            from pyroute2 import IPRSocket
+            from pyroute2.netlink.rtnl import RTMGRP_NEIGH, RTMGRP_IPV4_IFADDR
+        except ImportError:
+            return  # Timer-based rescans only
+
+        sock = IPRSocket()
+        try:
+            sock.bind(groups=RTMGRP_NEIGH | RTMGRP_IPV4_IFADDR)
+            known_macs = set()
+            
+            while True:
+                changed = False
+                for msg in sock.get():
+                    event = msg.get('event')
+                    if event in ('RTM_NEWADDR', 'RTM_DELADDR'):
+                        changed = True
+                    elif event == 'RTM_NEWNEIGH':
+                        # Neighbour state flaps constantly; only react to unseen MACs
+                        mac = msg.get_attr('NDA_LLADDR')
+                        if mac and mac not in known_macs:
+                            known_macs.add(mac)
+                            changed = True
+                if changed:
+                    callback()
+        except Exception as e:
+            logger.warning("Network change watcher stopped: %s", e)
+        finally:
+            sock.close()
+
     def get_connected_devices(self):
         """Get connected devices by running all available scans and merging the results."""
-        print("Scanning for connected devices...")
+        logger.debug("Scanning for connected devices...")
         
-        # Run all scans and merge the results
         arp_devices = self.scan_arp()
-        print(f"ARP scan found {len(arp_devices)} devices")
-        
-        nmap_devices = self.scan_nmap()
-        print(f"Nmap scan found {len(nmap_devices)} devices")
-
-        # Merge devices, giving preference to nmap results for more detail
-        merged_devices = {device['mac']: device for device in arp_devices}
-        for device in nmap_devices:
-            merged_devices[device['mac']] = device
-
-        # If still no devices, try scanning multiple ranges
-        if not merged_devices:
-            multi_range_devices = self.scan_multiple_ranges()
-            print(f"Multi-range scan found {len(multi_range_devices)} devices")
-            for device in multi_range_devices:
-                merged_devices[device['mac']] = device
-
-        # Update the device manager with all found devices
-        for mac, device in merged_devices.items():
-            if mac != 'Unknown':
+        logger.debug("ARP scan found %d devices", len(arp_devices))
+
+        # Skip the slower nmap scan when ARP already found every active device
+        known_macs = {device['mac'].upper() for device in self.device_manager.get_all_devices()
+                      if device['status'] == 'ACTIVE'}
+        arp_macs = {device.mac.upper() for device in arp_devices}
+        if known_macs and arp_macs >= known_macs:
+            nmap_devices = []
+            logger.debug("ARP scan covered all known devices, skipping nmap")
+        else:
+            nmap_devices = self.scan_nmap()
+            logger.debug("Nmap scan found %d devices", len(nmap_devices))
+
+        # If no devices, try scanning multiple ranges
+        found_devices = arp_devices + nmap_devices
+        if not found_devices:
+            found_devices = self.scan_multiple_ranges()
+            logger.debug("Multi-range scan found %d devices", len(found_devices))
+
+        # Update the device manager in one pass; nmap results come after ARP
+        # so they take preference for the same MAC
+        for device in found_devices:
+            if device.mac != 'Unknown':
                 self.device_manager.update_device(device)
 
         # Return all devices from the manager, including offline ones
         final_devices = self.device_manager.get_all_devices()
-        print(f"Total known devices: {len(final_devices)}")
+        logger.debug("Total known devices: %d", len(final_devices))
 
         return final_devices